@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, TypeVar
+import threading
+import time
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Thread-safe in-memory cache that evicts the least recently used entries.
+    Entries can expire after ttl seconds, and the cache can be bounded by entry
+    count (max_size) and/or by a total weight (max_weight, measured with weigh).
+    """
+
+    def __init__(
+        self,
+        max_size: int | None = None,
+        ttl: float | None = None,
+        max_weight: int | None = None,
+        weigh: Callable[[V], int] | None = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self._weigh = weigh
+        self._entries: OrderedDict[K, tuple[float, V, int]] = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> V | None:
+        """Returns the value for key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value, _ = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V) -> bool:
+        """Stores value under key. Returns False if it is too heavy to be cached at all."""
+        weight = self._weigh(value) if self._weigh is not None else 0
+        if self.max_weight is not None and weight > self.max_weight:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic(), value, weight)
+            self._weight += weight
+            while (self.max_size is not None and len(self._entries) > self.max_size) or (
+                self.max_weight is not None and self._weight > self.max_weight
+            ):
+                _, (_, _, old_weight) = self._entries.popitem(last=False)
+                self._weight -= old_weight
+        return True
+
+    def pop(self, key: K):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._weight = 0
+
+    def __contains__(self, key: K) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _remove(self, key: K):
+        _, _, weight = self._entries.pop(key)
+        self._weight -= weight
@@ -1,5 +1,7 @@
 import os
+from functools import lru_cache
 from pathlib import Path
+from typing import Literal
 from dotenv import load_dotenv
 from pydantic import BaseSettings
 
@@ -18,6 +20,15 @@ class Settings(BaseSettings):
     yt_dlp_cookies_file_path: str = (
         "yt_dlp_cookies.txt"  # default cookies file path at project root directory
     )
+    demucs_shifts: int = 1  # Demucs shifts for "fast" quality requests
+    demucs_high_quality_shifts: int = 2  # Demucs shifts for "high" quality requests
+    demucs_max_batch_size: int = 4  # concurrent requests separated in one forward pass
+    demucs_batch_wait_ms: int = 50  # how long to wait for more requests to batch
+    demucs_cache_max_mb: int = 512  # memory for reusing stems of repeated clips, 0 disables
+    demucs_preload: bool = True  # load and warm up Demucs at startup
+    demucs_compile: bool = False  # torch.compile the Demucs model on CUDA, compiled during warm-up
+    demucs_device: Literal["auto", "cuda", "mps", "cpu"] = "auto"  # Demucs torch device
+    demucs_dtype: Literal["auto", "bfloat16", "float16", "float32"] = "auto"  # Demucs autocast dtype, "float32" disables it
     spotify_client_id: str
     spotify_client_secret: str
     callback_api_key: str
@@ -26,6 +37,13 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
+        allow_mutation = False
 
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Returns the application settings, parsing the environment only once."""
+    return Settings()
+
+
+settings = get_settings()
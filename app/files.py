@@ -1,26 +1,342 @@
 from pathlib import Path
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import math
+import os
+import queue
 import re
 import shutil
+import subprocess
+import threading
+import time
+from typing import NamedTuple
 
+import numpy as np
 from fastapi import HTTPException
 from app.logger import logger
-def run_demucs_separation(audio_path: Path, output_path: Path) -> Path:
-    """Runs the Demucs separation process on a given audio file."""
-    from demucs.separate import main as demucs_separate
-    model_name = "htdemucs_6s"
+from app.cache import LRUCache
+from app.config import settings
+
+# Stems peaking at or below this level are treated as silent
+SILENCE_THRESHOLD_DB = -50.0
+
+# Allow Unicode letters, numbers, underscore, dash, and dot
+# u0590-u05FF covers the Hebrew block
+_SANITIZE_RE = re.compile(r"[^\w\-\.\u0590-\u05FF]", re.UNICODE)
+
+
+DEMUCS_MODEL_NAME = "htdemucs_6s"
+def _available_cpu_count() -> int:
+    """CPUs this process may run on, which respects affinity limits unlike os.cpu_count()."""
     try:
-        demucs_args = [
-            "-d",
-            "cpu",  # Use CPU for processing
-            f"--out={str(output_path)}",
-            f"--name={model_name}",
-            "--shifts",
-            "2",  # Use 2 shifts for better quality
-            str(audio_path),
-        ]
-        logger.info(f"Running Demucs on {audio_path} with output {output_path}")
-        logger.debug(f"Demucs args: {demucs_args}")
-        demucs_separate(demucs_args)
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # sched_getaffinity is not available on macOS and Windows
+        return os.cpu_count() or 1
+
+
+# On CPU, Demucs segments are spread over this many threads, and torch's
+# intra-op pool is shrunk to match so the two don't oversubscribe the cores.
+DEMUCS_CPU_WORKERS = max(1, _available_cpu_count() // 2)
+
+
+def get_demucs_device() -> str:
+    """Picks the fastest available torch device for Demucs, unless one is configured."""
+    import torch
+
+    if settings.demucs_device != "auto":
+        return settings.demucs_device
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def demucs_compile_enabled(device: str) -> bool:
+    """Whether the Demucs model is compiled, which is only done on CUDA."""
+    return settings.demucs_compile and device == "cuda"
+
+
+@functools.lru_cache(maxsize=1)
+def get_demucs_model():
+    """Loads the Demucs model once and keeps it on the chosen device for reuse across requests."""
+    from demucs.pretrained import get_model
+
+    device = get_demucs_device()
+    logger.info(f"Loading Demucs model {DEMUCS_MODEL_NAME} on {device}")
+    model = get_model(DEMUCS_MODEL_NAME)
+    model.to(device)
+    model.eval()
+    if get_demucs_num_workers(device):
+        import torch
+
+        # Each segment worker runs its own intra-op pool, keep the total at the core count
+        torch.set_num_threads(max(1, _available_cpu_count() // DEMUCS_CPU_WORKERS))
+    if settings.demucs_compile and not demucs_compile_enabled(device):
+        logger.warning("demucs_compile only applies on CUDA, running the model uncompiled")
+    if demucs_compile_enabled(device):
+        import torch
+        from demucs.apply import BagOfModels
+
+        sub_models = model.models if isinstance(model, BagOfModels) else [model]
+        for sub_model in sub_models:
+            # Split segments have a fixed length, so the captured CUDA graphs are reused.
+            # Only forward is compiled so apply_model still sees the HTDemucs module.
+            sub_model.forward = torch.compile(sub_model.forward, mode="reduce-overhead")
+        logger.info("Compiled Demucs model with torch.compile")
+    return model, device
+
+
+def warm_up_demucs_model():
+    """Loads the Demucs model and runs a short silent clip through it so the first request doesn't pay for it."""
+    import torch
+
+    model, device = get_demucs_model()
+    silence = torch.zeros(model.audio_channels, model.samplerate)
+    # Through the batcher like a request, so autocast and any compilation are warmed
+    # up on its thread, CUDA graphs captured by torch.compile are thread-local.
+    # A compiled model gets one batch per padded size, so each shape is captured.
+    batch_sizes = demucs_batcher.batch_sizes if demucs_compile_enabled(device) else [1]
+    for batch_size in batch_sizes:
+        futures = [demucs_batcher.submit(silence, settings.demucs_shifts) for _ in range(batch_size)]
+        for future in futures:
+            future.result()
+    logger.info("Demucs model warmed up")
+
+
+def get_demucs_autocast_dtype(device: str):
+    """Returns the reduced precision dtype to run Demucs with, or None for full precision."""
+    import torch
+
+    if settings.demucs_dtype == "auto":
+        if device != "cuda":
+            return None
+        # bfloat16 keeps float32's range, so prefer it where the GPU supports it
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+
+    dtype = getattr(torch, settings.demucs_dtype)
+    if dtype == torch.float32:
+        return None
+    # Half precision only pays off on GPU, CPU autocast supports bfloat16 only
+    if device == "cuda" or (device == "cpu" and dtype == torch.bfloat16):
+        return dtype
+    return None
+
+
+def get_demucs_num_workers(device: str) -> int:
+    """Returns how many threads apply_model spreads segments over, 0 to run them inline."""
+    # autocast is thread-local and doesn't reach apply_model's pool threads, so
+    # segments run inline whenever CPU autocast is enabled
+    if device == "cpu" and get_demucs_autocast_dtype(device) is None:
+        return DEMUCS_CPU_WORKERS
+    return 0
+
+
+def _apply_demucs(model, device: str, batch, shifts: int):
+    """Runs a (batch, channels, samples) tensor through Demucs, returning (batch, stems, channels, samples)."""
+    import torch
+    from demucs.apply import apply_model
+
+    autocast_dtype = get_demucs_autocast_dtype(device)
+    with torch.inference_mode(), torch.autocast(
+        device_type="cuda" if device == "cuda" else "cpu",
+        dtype=autocast_dtype,
+        enabled=autocast_dtype is not None,
+    ):
+        sources = apply_model(
+            model,
+            batch,
+            device=device,
+            shifts=shifts,
+            split=True,
+            overlap=0.25,
+            progress=False,
+            num_workers=get_demucs_num_workers(device),
+        )
+    return sources.float().cpu()
+
+
+class DemucsBatcher:
+    """
+    Collects separation requests from concurrent tasks and runs them through the
+    model together as one batch. A single worker thread owns the model, so requests
+    never run the model concurrently.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait: float):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        # Powers of two up to max_batch_size, the sizes batches are padded to when compiled
+        self.batch_sizes = [1 << i for i in range(max_batch_size.bit_length()) if 1 << i < max_batch_size]
+        self.batch_sizes.append(max_batch_size)
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def separate(self, wav, shifts: int):
+        """Separates a normalized (channels, samples) tensor, blocking until its batch is done."""
+        return self.submit(wav, shifts).result()
+
+    def submit(self, wav, shifts: int) -> concurrent.futures.Future:
+        """Queues a normalized (channels, samples) tensor, returning a future of its sources."""
+        future = concurrent.futures.Future()
+        self._queue.put((wav, shifts, future))
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="demucs-batcher", daemon=True
+                )
+                self._worker.start()
+        return future
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Only requests with the same number of shifts can share a forward pass
+            by_shifts = {}
+            for item in items:
+                by_shifts.setdefault(item[1], []).append(item)
+            for shifts, group in by_shifts.items():
+                self._process(group, shifts)
+
+    def _process(self, items, shifts: int):
+        import torch
+        import torch.nn.functional as F
+
+        try:
+            model, device = get_demucs_model()
+            # Zero-pad shorter clips to a common length so they can be stacked
+            length = max(wav.shape[-1] for wav, _, _ in items)
+            batch = torch.stack(
+                [F.pad(wav, (0, length - wav.shape[-1])) for wav, _, _ in items]
+            )
+            if demucs_compile_enabled(device):
+                # A compiled model captures a CUDA graph per batch shape. Padding to
+                # the next power of two keeps the shapes to the few warmed up at startup
+                # while costing a lone request at most twice its own work.
+                batch_size = next(size for size in self.batch_sizes if size >= len(items))
+                batch = F.pad(batch, (0, 0, 0, 0, 0, batch_size - len(items)))
+            logger.info(f"Running Demucs on a batch of {len(items)} (device: {device}, shifts: {shifts})")
+            sources = _apply_demucs(model, device, batch, shifts)
+        except Exception as e:
+            for _, _, future in items:
+                future.set_exception(e)
+            return
+
+        for (wav, _, future), item_sources in zip(items, sources):
+            future.set_result(item_sources[..., : wav.shape[-1]])
+
+
+demucs_batcher = DemucsBatcher(
+    max_batch_size=settings.demucs_max_batch_size,
+    max_wait=settings.demucs_batch_wait_ms / 1000,
+)
+
+
+def _separation_nbytes(entry: tuple[dict[str, np.ndarray], int]) -> int:
+    return sum(stem.nbytes for stem in entry[0].values())
+
+
+# Stems of recently separated clips, keyed by (clip sha256, shifts). Keying on
+# the clip's bytes means a repeated request only hits if the download matches.
+_separation_cache: LRUCache[tuple[str, int], tuple[dict[str, np.ndarray], int]] = LRUCache(
+    max_weight=settings.demucs_cache_max_mb * 1024 * 1024, weigh=_separation_nbytes
+)
+
+
+def _hash_audio_file(audio_path: Path) -> str:
+    with open(audio_path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _cache_separation(key: tuple[str, int], stems: dict[str, np.ndarray], samplerate: int):
+    # Cached stems are shared between requests, so they must never be mixed in place
+    for stem in stems.values():
+        stem.flags.writeable = False
+    _separation_cache.set(key, (stems, samplerate))
+
+
+class CachedClip(NamedTuple):
+    stems: dict[str, np.ndarray]
+    samplerate: int
+    # The encoded original_trimmed.mp3 of the downloaded clip
+    original_mp3: bytes
+    # Output (and bucket) folder the clip was uploaded to
+    dir_name: str
+
+
+def _clip_nbytes(clip: CachedClip) -> int:
+    return _separation_nbytes((clip.stems, clip.samplerate)) + len(clip.original_mp3)
+
+
+# Everything a repeat request for the same (video_id, start_time, duration, shifts)
+# needs to skip the download. The stems arrays are the same objects as in the
+# separation cache, so a clip cached in both only costs their memory once.
+_clip_cache: LRUCache[tuple[str, int, int, int], CachedClip] = LRUCache(
+    max_weight=settings.demucs_cache_max_mb * 1024 * 1024, weigh=_clip_nbytes
+)
+
+
+def get_cached_clip(clip_key: tuple[str, int, int, int]) -> CachedClip | None:
+    """Returns what was cached for clip_key by cache_clip, or None."""
+    return _clip_cache.get(clip_key)
+
+
+def cache_clip(
+    clip_key: tuple[str, int, int, int],
+    stems: dict[str, np.ndarray],
+    samplerate: int,
+    original_mp3_path: Path,
+    dir_name: str,
+):
+    """Caches a processed clip so a repeat request can be served without downloading it."""
+    for stem in stems.values():
+        stem.flags.writeable = False
+    _clip_cache.set(clip_key, CachedClip(stems, samplerate, original_mp3_path.read_bytes(), dir_name))
+
+
+def run_demucs_separation(audio_path: Path, shifts: int = 1) -> tuple[dict[str, np.ndarray], int]:
+    """
+    Runs the Demucs separation process on a given audio file. More shifts trade speed for quality.
+    The stems are kept in memory and never written to disk, and are reused for identical clips.
+    Returns ({stem_name: read-only float32 array of shape (channels, samples)}, samplerate).
+    """
+    from demucs.separate import load_track
+
+    stems = {}
+    try:
+        cache_key = (_hash_audio_file(audio_path), shifts)
+        cached = _separation_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Reusing cached Demucs stems for {audio_path}")
+            return cached
+
+        model, device = get_demucs_model()
+        logger.info(f"Separating {audio_path} with Demucs (device: {device}, shifts: {shifts})")
+
+        # Same normalization as the demucs CLI
+        wav = load_track(audio_path, model.audio_channels, model.samplerate)
+        ref = wav.mean(0)
+        wav = (wav - ref.mean()) / ref.std()
+        # Concurrent requests are batched into a single forward pass
+        sources = demucs_batcher.separate(wav, shifts)
+        sources = (sources * ref.std() + ref.mean()).numpy()
+
+        for source, name in zip(sources, model.sources):
+            stems[name] = source
         logger.info(f"Demucs separation completed for {audio_path}")
     except Exception as e:
         logger.error(f"An error occurred during Demucs processing: {e}")
@@ -28,151 +344,170 @@ def run_demucs_separation(audio_path: Path, output_path: Path) -> Path:
             status_code=500, detail=f"An error occurred during Demucs processing: {e}"
         )
 
-    separated_files_dir = output_path / model_name / Path(audio_path.stem)
-    if not separated_files_dir.exists() or not any(separated_files_dir.iterdir()):
-        logger.error("Audio separation failed. No output files were generated.")
+    if not stems:
+        logger.error("Audio separation failed. No stems were generated.")
         raise HTTPException(
             status_code=500,
-            detail="Audio separation failed. No output files were generated.",
+            detail="Audio separation failed. No stems were generated.",
         )
 
-    logger.debug(f"Separated files directory: {separated_files_dir}")
-    logger.debug(f"Separated files: {list(separated_files_dir.glob('*'))}")
-    return separated_files_dir
+    logger.debug("Separated stems: %s", list(stems))
+    _cache_separation(cache_key, stems, model.samplerate)
+    return stems, model.samplerate
+
+
+# Each exported mix and the stems it is built from, in export order
+STEM_MIXES: dict[str, tuple[str, ...]] = {
+    "drums.mp3": ("drums",),
+    "drums_bass.mp3": ("drums", "bass"),
+    "drums_bass_guitar.mp3": ("drums", "bass", "guitar"),
+    "drums_bass_guitar_other_piano.mp3": ("drums", "bass", "guitar", "other", "piano"),
+}
+ORIGINAL_MP3_NAME = "original_trimmed.mp3"
+# VBR V2 quality target; compression_level maps to LAME's -q algorithm
+# quality, 7 is a fast search with little audible difference at V2
+MP3_ENCODE_ARGS = ["-c:a", "libmp3lame", "-q:a", "2", "-compression_level", "7"]
+# Never read stdin and only print errors, so stderr stays small
+FFMPEG_BASE_ARGS = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-nostats", "-y"]
+FFMPEG_PIPE_BUFSIZE = 1024 * 1024
 
 
-def merge_stems_and_export(stems_dir: Path, trimmed_audio_path: Path, output_dir: Path):
+def run_ffmpeg(args: list[str], input: bytes | None = None):
     """
-    Merges stems as requested and exports them as mp3 files.
-    Returns a dict of {label: mp3_path}.
+    Runs ffmpeg with the common flags, discarding stdout and keeping stderr for error reporting.
+    If input is given it is fed to ffmpeg's stdin (use "pipe:0" as the input file).
     """
-    # Map stem names to files
-    logger.info(f"Merging stems in {stems_dir} and exporting to {output_dir}")
-    stem_files = {stem.stem: stem for stem in stems_dir.glob("*.wav")}
-    logger.debug(f"Found stem files: {stem_files}")
-    # Demucs 6s stem order: drums, bass, vocals, other, guitar, piano
-    # We'll use the actual file names to be robust
-
-    def get_non_silent(name):
-        f = next((f for s, f in stem_files.items() if name in s), None)
-        if f and is_wav_silent(f):
-            logger.info(f"Stem {name} ({f}) is silent. Ignoring.")
-            return None
-        return f
+    cmd = [*FFMPEG_BASE_ARGS, *args]
+    if input is None:
+        subprocess.run(
+            cmd,
+            check=True,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        return
 
-    drums = get_non_silent("drums")
-    bass = get_non_silent("bass")
-    guitar = get_non_silent("guitar")
-    other = get_non_silent("other")
-    piano = get_non_silent("piano")
-    # vocals = get("vocals")  # Not used in your requested mixes
+    # Write the input in large chunks rather than communicate()'s PIPE_BUF sized
+    # writes, draining stderr on a separate thread so ffmpeg never blocks on it
+    stderr_chunks = []
+    with subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        bufsize=FFMPEG_PIPE_BUFSIZE,
+    ) as proc:
+        reader = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()))
+        reader.start()
+        try:
+            proc.stdin.write(input)
+        except BrokenPipeError:
+            # ffmpeg exited early, its return code and stderr explain why
+            pass
+        finally:
+            # Close here so Popen's exit never flushes leftovers into a dead pipe
+            with contextlib.suppress(BrokenPipeError):
+                proc.stdin.close()
+        reader.join()
+        returncode = proc.wait()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=b"".join(stderr_chunks))
 
-    outputs = {}
 
-    def ffmpeg_merge(inputs, outname):
-        # Filter out None inputs (silent stems)
-        valid_inputs = [f for f in inputs if f is not None]
+def encode_mp3(samples: np.ndarray, samplerate: int, outpath: Path):
+    """Encodes a float32 array of shape (channels, samples) to mp3, piping raw PCM into ffmpeg."""
+    channels = samples.shape[0]
+    # Interleave channels as little-endian float32 frames
+    pcm = np.ascontiguousarray(samples.T, dtype="<f4").tobytes()
+    run_ffmpeg(
+        [
+            "-f", "f32le",
+            "-ar", str(samplerate),
+            "-ac", str(channels),
+            "-i", "pipe:0",
+            *MP3_ENCODE_ARGS,
+            str(outpath),
+        ],
+        input=pcm,
+    )
 
-        if not valid_inputs:
-            logger.info(f"All inputs for {outname} are silent/missing. Skipping generation.")
-            return None
 
-        outpath = output_dir / outname
-        cmd = [
-            "ffmpeg",
-            *sum([["-i", str(f)] for f in valid_inputs], []),
-            "-filter_complex",
-            f"amix=inputs={len(valid_inputs)}:duration=longest:dropout_transition=0",
-            "-c:a",
-            "libmp3lame",
-            "-q:a",
-            "2",
-            "-y",
-            str(outpath),
-        ]
-        subprocess.run(cmd, check=True, capture_output=True)
-        return outpath
+def select_stem_mixes(stems: dict[str, np.ndarray]) -> dict[str, list[np.ndarray] | None]:
+    """
+    Picks the non-silent stems that make up each mix in STEM_MIXES, from a dict of
+    {stem_name: (channels, samples) array}.
+    Returns a dict of {label: stems_to_sum}, with None for mixes that would be empty.
+    """
+    logger.info(f"Selecting stems for mixes from {list(stems)}")
 
-    # 1. Drums only
-    outputs["drums.mp3"] = ffmpeg_merge([drums], "drums.mp3")
+    # vocals are not used in any of the mixes
+    used_stems = dict.fromkeys(name for names in STEM_MIXES.values() for name in names)
+    non_silent = {}
+    for name in used_stems:
+        if name not in stems:
+            continue
+        if is_audio_silent(stems[name]):
+            logger.info(f"Stem {name} is silent. Ignoring.")
+            continue
+        non_silent[name] = stems[name]
 
-    # 2. Drums + Bass
-    outputs["drums_bass.mp3"] = ffmpeg_merge([drums, bass], "drums_bass.mp3")
+    mixes = {}
+    for outname, names in STEM_MIXES.items():
+        # Silent/missing stems are left out of the mix
+        selected = [non_silent[name] for name in names if name in non_silent]
+        if not selected:
+            logger.info(f"All inputs for {outname} are silent/missing. Skipping generation.")
+            mixes[outname] = None
+            continue
+        mixes[outname] = selected
+    return mixes
 
-    # 3. Drums + Bass + Guitar
-    outputs["drums_bass_guitar.mp3"] = ffmpeg_merge(
-        [drums, bass, guitar], "drums_bass_guitar.mp3"
-    )
 
-    # 4. Drums + Bass + Guitar + Other + Piano
-    outputs["drums_bass_guitar_other_piano.mp3"] = ffmpeg_merge(
-        [drums, bass, guitar, other, piano], "drums_bass_guitar_other_piano.mp3"
-    )
+def mix_and_export_mp3(selected: list[np.ndarray], samplerate: int, outpath: Path) -> Path:
+    """Sums the given stems and encodes the mix to an mp3 file."""
+    # Stems add back up to the original, so sum them with unit gain
+    mix = selected[0].copy()
+    for stem in selected[1:]:
+        mix += stem
+    logger.info(f"Exporting mix of {len(selected)} stems to {outpath}")
+    encode_mp3(mix, samplerate, outpath)
+    return outpath
 
-    # 5. Original trimmed mp3
-    # Convert trimmed wav to mp3
-    orig_mp3 = output_dir / "original_trimmed.mp3"
-    subprocess.run(
-        [
-            "ffmpeg",
-            "-i",
-            str(trimmed_audio_path),
-            "-c:a",
-            "libmp3lame",
-            "-q:a",
-            "2",
-            "-y",
-            str(orig_mp3),
-        ],
-        check=True,
-        capture_output=True,
-    )
-    outputs["original_trimmed.mp3"] = orig_mp3
 
-    return outputs
+def write_original_mp3(original_mp3: bytes, output_dir: Path) -> Path:
+    """Writes a cached original_trimmed.mp3, for when the download was skipped."""
+    orig_mp3 = output_dir / ORIGINAL_MP3_NAME
+    orig_mp3.write_bytes(original_mp3)
+    return orig_mp3
+
+
+def export_original_mp3(trimmed_audio_path: Path, output_dir: Path) -> Path:
+    """Converts the original trimmed audio to mp3. Does not depend on the separated stems."""
+    orig_mp3 = output_dir / ORIGINAL_MP3_NAME
+    logger.info(f"Exporting original trimmed audio {trimmed_audio_path} to {orig_mp3}")
+    run_ffmpeg(["-i", str(trimmed_audio_path), *MP3_ENCODE_ARGS, str(orig_mp3)])
+    return orig_mp3
 
 
 # --- Helper Functions ---
-def is_wav_silent(file_path: Path) -> bool:
-    """Checks if a WAV file is completely silent using ffmpeg volumedetect."""
-    logger.info(f"Checking if {file_path} is silent")
-    cmd = [
-        "ffmpeg",
-        "-i",
-        str(file_path),
-        "-af",
-        "volumedetect",
-        "-f",
-        "null",
-        "-",
-    ]
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        # Look for max_volume in stderr: max_volume: -91.0 dB or max_volume: -inf dB
-        match = re.search(r"max_volume: ([\-\d\.]+|inf) dB", result.stderr)
-        if match:
-            max_vol_str = match.group(1)
-            if max_vol_str == "-inf" or max_vol_str == "inf": # inf shouldn't happen for volume but just in case
-                logger.info(f"File {file_path} is silent (-inf dB).")
-                return True
-            try:
-                max_vol = float(max_vol_str)
-                if max_vol <= -50.0:
-                    logger.info(f"File {file_path} is silent ({max_vol} dB).")
-                    return True
-            except ValueError:
-                pass
-        return False
-    except Exception as e:
-        logger.error(f"Error checking silence for {file_path}: {e}")
-        return False
+def is_audio_silent(samples: np.ndarray) -> bool:
+    """Checks if in-memory audio is silent by comparing its peak amplitude to the silence threshold."""
+    peak = float(np.abs(samples).max()) if samples.size else 0.0
+    if peak == 0.0:
+        logger.info("Audio is silent (-inf dB).")
+        return True
+    max_vol = 20 * math.log10(peak)
+    if max_vol <= SILENCE_THRESHOLD_DB:
+        logger.info(f"Audio is silent ({max_vol:.1f} dB).")
+        return True
+    return False
 
 
+@functools.lru_cache(maxsize=1024)
 def sanitize_filename(name: str) -> str:
     """Sanitize a string to be safe for use as a directory or file name, allowing Unicode (including Hebrew) characters."""
-    # Allow Unicode letters, numbers, underscore, dash, and dot
-    # u0590-u05FFFF covers all Unicode code points
-    return re.sub(r"[^\w\-\.\u0590-\u05FF]", "_", name, flags=re.UNICODE)
+    return _SANITIZE_RE.sub("_", name)
 
 
 def cleanup_files(*paths):
@@ -182,14 +517,15 @@ def cleanup_files(*paths):
             if path is None:
                 logger.debug("cleanup_files: Skipping None path.")
                 continue
-            if path.is_dir():
+            # Try the removal directly instead of stat-ing the path first
+            try:
                 shutil.rmtree(path)
                 logger.info(f"Removed directory: {path}")
-            elif path.exists():
+            except NotADirectoryError:
                 path.unlink()
                 logger.info(f"Removed file: {path}")
-            else:
-                logger.debug(f"cleanup_files: Path does not exist: {path}")
+        except FileNotFoundError:
+            logger.debug("cleanup_files: Path does not exist: %s", path)
         except Exception as e:
             logger.error(f"Error cleaning up {path}: {e}")
 
@@ -1,14 +1,31 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from app.config import settings
+from app.files import warm_up_demucs_model
 from app.logger import logger
 from app.routes import router
+from app.service import close_callback_client, stop_callback_worker
 from app.security import get_api_key
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the Demucs weights once, before the first request needs them
+    if settings.demucs_preload:
+        await asyncio.to_thread(warm_up_demucs_model)
+    yield
+    await stop_callback_worker()
+    await close_callback_client()
+
+
 # --- FastAPI App Initialization ---
 app = FastAPI(
     title="Demucs Audio Separator",
     description="An API to separate audio files into their instrumental stems (drums, bass, vocals, other) using the Demucs model. Can process direct file uploads or audio from YouTube links.",
     version="1.1.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware to allow all origins
@@ -47,7 +47,8 @@ async def separate_from_link(
         request.url,
         request.start_time,
         request.duration,
-        request.callback_url
+        request.callback_url,
+        request.quality,
     )
     return {"message": "Request received and processing started", "status": "pending"}
 
@@ -1,10 +1,12 @@
 import oci
 import concurrent.futures
+import functools
+from oci._vendor.requests.adapters import HTTPAdapter
 from fastapi import HTTPException
 from pathlib import Path
 from app.logger import logger
 from app.config import settings
-from typing import Dict, Tuple
+from typing import Dict, Iterator, Tuple
 from urllib.parse import quote
 
 
@@ -17,12 +19,66 @@ NAMESPACE_NAME = settings.storage_namespace
 BUCKET_NAME = settings.storage_bucket_name
 CONFIG_FILE_PATH = Path(settings.oci_config_path)
 
+# Files larger than this are uploaded as multipart uploads with parallel parts
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+PARALLEL_PART_UPLOADS = 8
+# Uploads and their parts share one session, keep enough idle connections
+# around so they reuse TLS sessions instead of reconnecting
+HTTP_POOL_MAXSIZE = 64
+# Uploads from every request share one long-lived thread pool
+UPLOAD_POOL_MAX_WORKERS = 32
+
 config = oci.config.from_file(file_location=CONFIG_FILE_PATH)
 object_storage_client = oci.object_storage.ObjectStorageClient(config)
-def _upload_and_get_public_url(
+object_storage_client.base_client.session.mount(
+    "https://", HTTPAdapter(pool_maxsize=HTTP_POOL_MAXSIZE)
+)
+upload_manager = oci.object_storage.UploadManager(
+    object_storage_client,
+    allow_multipart_uploads=True,
+    allow_parallel_uploads=True,
+    parallel_process_count=PARALLEL_PART_UPLOADS,
+)
+upload_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=UPLOAD_POOL_MAX_WORKERS, thread_name_prefix="oci-upload"
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_public_url_prefix(
     client: oci.object_storage.ObjectStorageClient,
     namespace: str,
     bucket_name: str,
+) -> str:
+    """
+    Builds the public URL prefix for objects in a bucket.
+    An object's public URL is this prefix followed by its quoted object name.
+    The region and endpoint never change, so the prefix is cached per bucket.
+    """
+    # Prefer tenancy-specific endpoint (console's new URL format) when the
+    # SDK endpoint is the generic one. Construct a tenant-specific host
+    # like: https://{namespace}.objectstorage.{region}.oci.customer-oci.com
+    region = client.base_client.config.get("region")
+    sdk_endpoint = client.base_client.endpoint.rstrip("/")
+
+    tenant_endpoint = f"https://{namespace}.objectstorage.{region}.oci.customer-oci.com"
+
+    # If the SDK endpoint looks like the old generic endpoint, switch to
+    # the tenancy-specific host; otherwise keep the SDK endpoint (it may
+    # already be tenancy-specific or customized).
+    if sdk_endpoint.endswith(f"objectstorage.{region}.oraclecloud.com"):
+        base_endpoint = tenant_endpoint
+    else:
+        base_endpoint = sdk_endpoint
+
+    return f"{base_endpoint}/n/{namespace}/b/{bucket_name}/o/"
+
+
+def _upload_and_get_public_url(
+    manager: oci.object_storage.UploadManager,
+    url_prefix: str,
+    namespace: str,
+    bucket_name: str,
     local_file_path: str,
     object_name: str,
 ) -> Tuple[str, str]:
@@ -31,20 +87,23 @@ def _upload_and_get_public_url(
     This function will be executed in a separate thread.
     """
     logger.info(
-        f"Uploading file '{local_file_path}' as object '{object_name}' to bucket '{bucket_name}'..."
+        "Uploading file '%s' as object '%s' to bucket '%s'...",
+        local_file_path,
+        object_name,
+        bucket_name,
     )
     # Upload the file
     try:
-        logger.debug(f"Opening file '{local_file_path}' for upload.")
-        with open(local_file_path, "rb") as f:
-            logger.debug(f"Calling put_object for '{object_name}'.")
-            response: oci.Response = client.put_object(
-                namespace_name=namespace,
-                bucket_name=bucket_name,
-                object_name=object_name,
-                put_object_body=f,
-            )
-        logger.debug(f"put_object response status: {response.status}")
+        response: oci.Response = manager.upload_file(
+            namespace_name=namespace,
+            bucket_name=bucket_name,
+            object_name=object_name,
+            file_path=local_file_path,
+            part_size=MULTIPART_PART_SIZE,
+        )
+        logger.debug(
+            "upload_file for '%s' returned status %s", object_name, response.status
+        )
         if response.status != 200:
             logger.error(
                 f"Failed to upload '{local_file_path}' to bucket '{bucket_name}': status={response.status}"
@@ -52,7 +111,7 @@ def _upload_and_get_public_url(
             raise S3UploadError(
                 f"Failed to upload '{local_file_path}' to bucket '{bucket_name}': status={response.status}"
             )
-        logger.info(f"Successfully uploaded '{local_file_path}' to '{object_name}'.")
+        logger.info("Successfully uploaded '%s' to '%s'.", local_file_path, object_name)
     except Exception as e:
         logger.error(
             f"Exception during upload of '{local_file_path}' to bucket '{bucket_name}': {e}"
@@ -61,28 +120,11 @@ def _upload_and_get_public_url(
             f"Exception during upload of '{local_file_path}' to bucket '{bucket_name}': {e}"
         )
 
-    logger.info(f"Constructing public URL for '{object_name}'...")
     try:
-        # Prefer tenancy-specific endpoint (console's new URL format) when the
-        # SDK endpoint is the generic one. Construct a tenant-specific host
-        # like: https://{namespace}.objectstorage.{region}.oci.customer-oci.com
-        region = client.base_client.config.get("region")
-        sdk_endpoint = client.base_client.endpoint.rstrip("/")
-
-        tenant_endpoint = f"https://{namespace}.objectstorage.{region}.oci.customer-oci.com"
-
-        # If the SDK endpoint looks like the old generic endpoint, switch to
-        # the tenancy-specific host; otherwise keep the SDK endpoint (it may
-        # already be tenancy-specific or customized).
-        if sdk_endpoint.endswith(f"objectstorage.{region}.oraclecloud.com"):
-            base_endpoint = tenant_endpoint
-        else:
-            base_endpoint = sdk_endpoint
-
         quoted_object = quote(object_name, safe="")
-        public_url = f"{base_endpoint}/n/{namespace}/b/{bucket_name}/o/{quoted_object}"
+        public_url = f"{url_prefix}{quoted_object}"
 
-        logger.info(f"Constructed public URL for '{object_name}': {public_url}")
+        logger.info("Constructed public URL for '%s': %s", object_name, public_url)
 
         file_name = Path(local_file_path).name
         return file_name, public_url
@@ -101,7 +143,6 @@ def upload_and_get_presigned_urls(
     upload_folder: str,
     namespace: str = NAMESPACE_NAME,
     bucket_name: str = BUCKET_NAME,
-    max_workers: int = 5,
 ) -> Dict[str, str]:
     """
     Uploads specific files to an OCI Object Storage bucket
@@ -112,7 +153,6 @@ def upload_and_get_presigned_urls(
         upload_folder (str): The folder name in the bucket where files will be stored.
         namespace (str): The object storage namespace.
         bucket_name (str): The name of the bucket.
-        max_workers (int): The number of worker threads to use for parallel uploads.
 
     Returns:
         Dict[str, str]: A dictionary of file names and their public URLs for the uploaded files.
@@ -128,20 +168,27 @@ def upload_and_get_presigned_urls(
         logger.info(
             f"Uploading {len(file_paths)} files to bucket '{bucket_name}' in folder '{upload_folder}'..."
         )
-        logger.info(f"Using a thread pool with {max_workers} workers.")
+        # The URL prefix is the same for every file, it is built once and cached
+        try:
+            url_prefix = _get_public_url_prefix(
+                object_storage_client, namespace, bucket_name
+            )
+        except Exception as e:
+            logger.error(f"Exception during public URL prefix construction: {e}")
+            raise S3UploadError(
+                f"Exception during public URL prefix construction: {e}"
+            )
 
-        # Use ThreadPoolExecutor to perform uploads and URL generation in parallel
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            tasks = []
+        # Perform uploads and URL generation in parallel on the shared pool
+        tasks = []
+        try:
             for file_path in file_paths:
                 object_name = f"{upload_folder}/{file_path.name}"
-                logger.info(
-                    f"Scheduling upload and public URL generation for '{file_path}'."
-                )
                 tasks.append(
-                    executor.submit(
+                    upload_pool.submit(
                         _upload_and_get_public_url,
-                        object_storage_client,
+                        upload_manager,
+                        url_prefix,
                         namespace,
                         bucket_name,
                         str(file_path),
@@ -156,8 +203,9 @@ def upload_and_get_presigned_urls(
                     if result:
                         file_name, url = result
                         public_urls[file_name] = url
-                    logger.info(
-                        f" - Successfully processed one file. Total URLs: {len(public_urls)}"
+                    logger.debug(
+                        " - Successfully processed one file. Total URLs: %d",
+                        len(public_urls),
                     )
                 except S3UploadError as exc:
                     logger.error(f"A file generation task failed: {exc}")
@@ -167,6 +215,10 @@ def upload_and_get_presigned_urls(
                     raise S3UploadError(
                         f"Unexpected error in file generation task: {exc}"
                     )
+        finally:
+            # Drop uploads of this batch that have not started yet on failure
+            for task in tasks:
+                task.cancel()
 
         return public_urls
 
@@ -179,6 +231,27 @@ def upload_and_get_presigned_urls(
         raise S3UploadError(f"An unexpected error occurred: {e}")
 
 
+def _iter_list_objects_pages(
+    **kwargs,
+) -> Iterator[oci.object_storage.models.ListObjects]:
+    """
+    Yields every page of a list_objects call, following next_start_with
+    so buckets with more than one page of results are not truncated.
+    """
+    start = None
+    while True:
+        response: oci.Response = object_storage_client.list_objects(
+            namespace_name=NAMESPACE_NAME,
+            bucket_name=BUCKET_NAME,
+            start=start,
+            **kwargs,
+        )
+        yield response.data
+        start = response.data.next_start_with
+        if not start:
+            return
+
+
 def list_directories(directory: str | None):
     try:
         logger.info(
@@ -188,33 +261,24 @@ def list_directories(directory: str | None):
         if directory:
             # List objects inside the specified directory
             prefix = f"{directory}/"
-            response = object_storage_client.list_objects(
-                namespace_name=NAMESPACE_NAME,
-                bucket_name=BUCKET_NAME,
-                prefix=prefix,
-                fields="name",
-            )
-            objects = [obj.name for obj in response.data.objects]
+            objects = [
+                obj.name
+                for page in _iter_list_objects_pages(prefix=prefix, fields="name")
+                for obj in page.objects
+            ]
             logger.info(f"Found {len(objects)} objects in directory '{directory}'.")
             return {"directory": directory, "objects": objects}
         else:
-            # List all directories (prefixes)
-            response: oci.Response = object_storage_client.list_objects(
-                namespace_name=NAMESPACE_NAME,
-                bucket_name=BUCKET_NAME,
-                fields="name",
-            )
-            response_data: oci.object_storage.models.ListObjects = response.data
-            objects: list[oci.object_storage.models.ObjectSummary] = (
-                response_data.objects
-            )
-            directories = set(
-                obj.name.split("/")[0] for obj in objects if "/" in obj.name
-            )
+            # List all directories, the service groups names into prefixes
+            directories = [
+                prefix.rstrip("/")
+                for page in _iter_list_objects_pages(delimiter="/", fields="name")
+                for prefix in page.prefixes or []
+            ]
             logger.info(
                 f"Found {len(directories)} directories in bucket '{BUCKET_NAME}'."
             )
-            return {"directories": list(directories)}
+            return {"directories": directories}
     except oci.exceptions.ServiceError as e:
         logger.error(f"OCI ServiceError: {e.code} - {e.message}")
         raise HTTPException(
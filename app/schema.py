@@ -1,24 +1,55 @@
-from pydantic import BaseModel, Field, HttpUrl
-from typing import Literal
+import re
+from pydantic import BaseModel, Field, validator
+from typing import Literal, get_args
 
 StatusOptions = Literal["pending", "in_progress", "completed", "failed"]
 FileKey = Literal["drums", "bass", "guitar", "other", "original"]
+FILE_KEYS = frozenset(get_args(FileKey))
+QualityOptions = Literal["fast", "high"]
 
-class TaskStatusUpdate(BaseModel):
+_YT_OR_SPOTIFY_RE = re.compile(
+    r"https?://(?:(?:www|m|music)\.)?(?:youtube\.com|youtu\.be|open\.spotify\.com)/\S*"
+)
+_HTTP_URL_RE = re.compile(r"https?://\S+")
+
+class _FrozenModel(BaseModel):
+    """Base for payloads built once and only read afterwards."""
+
+    class Config:
+        allow_mutation = False
+        # Nested models are immutable, so they can be reused instead of copied
+        copy_on_model_validation = "none"
+
+class TaskStatusUpdate(_FrozenModel):
     status: StatusOptions = Field(..., description="Current status of the task")
     message: str = Field(description="Optional message providing additional information about the task status")
 
 class SeparateFromLinkRequest(BaseModel):
-    url: HttpUrl = Field(..., description="The YouTube or Spotify URL")
+    url: str = Field(..., description="The YouTube or Spotify URL")
     start_time: int | None = Field(None, ge=0, description="Start time in seconds for the audio clip. If not specified, will be auto-picked using the heatmap.")
     duration: int = Field(30, gt=0, le=300, description="Duration of the audio clip in seconds (max 300).")
-    callback_url: HttpUrl = Field(..., description="URL to receive task status updates via POST requests.")
+    callback_url: str = Field(..., max_length=2048, description="URL to receive task status updates via POST requests.")
+    quality: QualityOptions = Field("fast", description="Separation quality. 'high' runs more Demucs shifts and is slower.")
 
-class AlbumMetadata(BaseModel):
+    @validator("url")
+    def validate_url(cls, value: str) -> str:
+        # Checking the host is enough, yt-dlp and Spotify reject anything bogus.
+        # fullmatch, unlike $, doesn't let a trailing newline through.
+        if not _YT_OR_SPOTIFY_RE.fullmatch(value):
+            raise ValueError("URL must be a YouTube or Spotify link")
+        return value
+
+    @validator("callback_url")
+    def validate_callback_url(cls, value: str) -> str:
+        if not _HTTP_URL_RE.fullmatch(value):
+            raise ValueError("Callback URL must be an http(s) URL")
+        return value
+
+class AlbumMetadata(_FrozenModel):
     name: str = Field(..., description="Name of the album")
     images: list[str] = Field(..., description="List of image URLs for the album")
 
-class SongMetadata(BaseModel):
+class SongMetadata(_FrozenModel):
     title: str = Field(..., description="Title of the song")
     artists: list[str] = Field(..., description="Artists of the song")
     album: AlbumMetadata = Field(..., description="Album metadata of the song")
@@ -26,8 +57,15 @@ class SongMetadata(BaseModel):
     youtube_views: int = Field(..., description="Number of YouTube views for the song")
     year: int = Field(..., description="Release year of the song")
 
-class UpdateTaskBody(BaseModel):
+class UpdateTaskBody(_FrozenModel):
     task_status: TaskStatusUpdate = Field(..., description="Status update for the task")
     song_metadata: SongMetadata = Field(..., description="Metadata of the song")
-    file_keys: dict[FileKey, str | None] = Field(..., description="Mapping of file (object storage) keys for the song files")
+    file_keys: dict[str, str | None] = Field(..., description="Mapping of file (object storage) keys for the song files")
+
+    @validator("file_keys")
+    def validate_file_keys(cls, value: dict[str, str | None]) -> dict[str, str | None]:
+        invalid_keys = value.keys() - FILE_KEYS
+        if invalid_keys:
+            raise ValueError(f"Invalid file keys: {sorted(invalid_keys)}")
+        return value
     
\ No newline at end of file
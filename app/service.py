@@ -1,16 +1,17 @@
+from collections import deque
 from pathlib import Path
 from fastapi import HTTPException
-from pydantic import HttpUrl, BaseModel
+from pydantic import BaseModel
 import asyncio
 import httpx
 
-from app.files import cleanup_files, merge_stems_and_export, run_demucs_separation, sanitize_filename
+from app.files import ORIGINAL_MP3_NAME, cache_clip, cleanup_files, export_original_mp3, get_cached_clip, mix_and_export_mp3, run_demucs_separation, sanitize_filename, select_stem_mixes, write_original_mp3
 from app.s3 import upload_and_get_presigned_urls
 from app.logger import logger
 from app import s3
 from app.spotify import get_random_track_from_playlist
-from app.youtube import download_and_trim_youtube_audio
-from app.schema import TaskStatusUpdate, UpdateTaskBody, SongMetadata
+from app.youtube import download_and_trim_youtube_audio, get_cached_video_info, get_youtube_video_id
+from app.schema import TaskStatusUpdate, UpdateTaskBody, SongMetadata, QualityOptions
 from app.config import settings
 
 # --- Configuration ---
@@ -22,101 +23,202 @@ DOWNLOAD_DIR = Path("temp_downloads")
 for dir_path in [UPLOAD_DIR, OUTPUT_DIR, DOWNLOAD_DIR]:
     dir_path.mkdir(exist_ok=True)
 
+# Callbacks share one client so repeat posts to the callback host reuse connections
+_callback_client: httpx.AsyncClient | None = None
+
+def get_callback_client() -> httpx.AsyncClient:
+    global _callback_client
+    if _callback_client is None or _callback_client.is_closed:
+        _callback_client = httpx.AsyncClient(
+            timeout=10,
+            limits=httpx.Limits(max_keepalive_connections=32),
+        )
+    return _callback_client
+
+async def close_callback_client():
+    global _callback_client
+    if _callback_client is not None:
+        await _callback_client.aclose()
+        _callback_client = None
+
 async def update_task_status(url: str, data: BaseModel):
-    async with httpx.AsyncClient() as client:
-        try:
-            # Pydantic v1 uses .dict()
-            response = await client.post(url, json=data.dict(), headers={"x-api-key": settings.callback_api_key})
-            response.raise_for_status()
-            logger.info(f"Callback sent to {url}: {response.status_code}")
-        except Exception as e:
-            logger.error(f"Failed to send callback to {url}: {e}")
+    client = get_callback_client()
+    try:
+        # Pydantic v1 uses .dict()
+        response = await client.post(url, json=data.dict(), headers={"x-api-key": settings.callback_api_key})
+        response.raise_for_status()
+        logger.info(f"Callback sent to {url}: {response.status_code}")
+    except Exception as e:
+        logger.error(f"Failed to send callback to {url}: {e}")
+
+# Each callback URL gets its own worker, so its callbacks arrive in order, a slow
+# callback host only delays its own task and none are lost as unreferenced
+# fire-and-forget tasks. A worker exits once its URL has nothing left to send.
+_pending_callbacks: dict[str, deque[BaseModel]] = {}
+_callback_workers: dict[str, asyncio.Task] = {}
+
+async def _run_callback_worker(url: str):
+    pending = _pending_callbacks[url]
+    try:
+        while pending:
+            await update_task_status(url, pending.popleft())
+    finally:
+        _pending_callbacks.pop(url, None)
+        _callback_workers.pop(url, None)
+
+def send_task_status(url: str, data: BaseModel):
+    """Queues a status callback. Must be called from the event loop thread."""
+    pending = _pending_callbacks.get(url)
+    if pending is None:
+        pending = _pending_callbacks[url] = deque()
+        _callback_workers[url] = asyncio.create_task(_run_callback_worker(url))
+    pending.append(data)
+
+async def stop_callback_worker(timeout: float = 10):
+    """Waits for queued callbacks to be sent, then stops any workers still running."""
+    workers = list(_callback_workers.values())
+    if not workers:
+        return
+    _, unfinished = await asyncio.wait(workers, timeout=timeout)
+    if unfinished:
+        logger.warning("Timed out waiting for queued callbacks to be sent")
+        for worker in unfinished:
+            worker.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+    _pending_callbacks.clear()
+    _callback_workers.clear()
 
 async def process_link_separation_task(
-    url: HttpUrl,
+    url: str,
     start_time: int | None,
     duration: int,
-    callback_url: HttpUrl,
+    callback_url: str,
+    quality: QualityOptions = "fast",
 ):
     trimmed_audio_path = None
     temp_output_path = None
-    callback_url_str = str(callback_url)
-    loop = asyncio.get_running_loop()
+    callback_url_str = callback_url
 
     # Initial Status
-    asyncio.create_task(update_task_status(callback_url_str, TaskStatusUpdate(status="pending", message="Task started")))
+    send_task_status(callback_url_str, TaskStatusUpdate(status="pending", message="Task started"))
 
     try:
-        url_str = str(url)
+        url_str = url
         logger.info(f"Processing task for {url_str}")
 
-        # Download
-        # Using asyncio.to_thread for blocking download
-        def _download():
-             # Spotify detection logic moved here to ensure thread safety if needed, 
-             # though strictly not required if get_random_track_from_playlist is sync and safe.
-             # However, we need to modify search term based on it.
-             _search_term = None
-             _spotify_track = None
-             if "spotify.com" in url_str:
-                logger.info(f"Detected Spotify link: {url_str}")
-                try:
-                    asyncio.run_coroutine_threadsafe(
-                        update_task_status(callback_url_str, TaskStatusUpdate(status="in_progress", message="Searching Spotify track")),
-                        loop
-                    )
-                    _spotify_track = get_random_track_from_playlist(url_str)
-                    track_name = _spotify_track["name"]
-                    track_artist = _spotify_track["artists"][0]["name"]
-                    logger.info(f"Selected track: {track_name} by {track_artist}")
-                    _search_term = f"{track_artist} - {track_name}"
-                except Exception as e:
-                    logger.error(f"Failed to fetch track from Spotify: {e}")
-                    raise HTTPException(
-                        status_code=500, detail=f"Failed to fetch track from Spotify: {e}"
-                    )
-             
-             asyncio.run_coroutine_threadsafe(
-                 update_task_status(callback_url_str, TaskStatusUpdate(status="in_progress", message="Downloading audio from YouTube")),
-                 loop
-             )
-        
-             _trimmed_audio_path, _video_info = download_and_trim_youtube_audio(
-                url_str, start_time, duration, DOWNLOAD_DIR, _search_term
-             )
-             return _trimmed_audio_path, _video_info, _spotify_track
+        # Resolve Spotify links to a YouTube search term
+        search_term = None
+        spotify_track = None
+        if "spotify.com" in url_str:
+            logger.info(f"Detected Spotify link: {url_str}")
+            send_task_status(callback_url_str, TaskStatusUpdate(status="in_progress", message="Searching Spotify track"))
+            try:
+                spotify_track = await asyncio.to_thread(get_random_track_from_playlist, url_str)
+                track_name = spotify_track["name"]
+                track_artist = spotify_track["artists"][0]["name"]
+                logger.info(f"Selected track: {track_name} by {track_artist}")
+                search_term = f"{track_artist} - {track_name}"
+            except Exception as e:
+                logger.error(f"Failed to fetch track from Spotify: {e}")
+                raise HTTPException(
+                    status_code=500, detail=f"Failed to fetch track from Spotify: {e}"
+                )
 
-        trimmed_audio_path, video_info, spotify_track = await asyncio.to_thread(_download)
-        
-        asyncio.create_task(update_task_status(callback_url_str, TaskStatusUpdate(status="in_progress", message="Separating audio")))
+        shifts = settings.demucs_high_quality_shifts if quality == "high" else settings.demucs_shifts
+
+        # A YouTube link with an explicit start time always maps to the same clip,
+        # so a repeat request can reuse its results without downloading it again
+        clip_key = None
+        cached_clip = None
+        video_id = get_youtube_video_id(url_str) if search_term is None and start_time is not None else None
+        if video_id is not None:
+            clip_key = (video_id, start_time, duration, shifts)
+            cached_clip = get_cached_clip(clip_key)
+            if cached_clip is not None:
+                # Without the video's metadata the clip is downloaded as usual
+                video_info = await asyncio.to_thread(get_cached_video_info, url_str)
+                if video_info is None:
+                    cached_clip = None
 
-        # ... Setup paths ...
-        if trimmed_audio_path.stem.startswith("trimmed_"):
-            video_title = trimmed_audio_path.stem.replace("trimmed_", "")
+        if cached_clip is not None:
+            logger.info(f"Reusing cached clip for {clip_key}, skipping the download")
+            # Same folder as the first request, which was named after the downloaded file
+            dir_name = cached_clip.dir_name
         else:
-            video_title = trimmed_audio_path.stem
-        dir_name = sanitize_filename(video_title)
+            # Download
+            send_task_status(callback_url_str, TaskStatusUpdate(status="in_progress", message="Downloading audio from YouTube"))
+            trimmed_audio_path, video_info = await asyncio.to_thread(
+                download_and_trim_youtube_audio,
+                url_str, start_time, duration, DOWNLOAD_DIR, search_term,
+            )
+            # Only strip the prefix, a title may itself contain "trimmed_"
+            video_title = trimmed_audio_path.stem.removeprefix("trimmed_")
+            dir_name = sanitize_filename(video_title)
+
+        send_task_status(callback_url_str, TaskStatusUpdate(status="in_progress", message="Separating audio"))
+
         temp_output_path = OUTPUT_DIR / dir_name
         
         logger.info(f"Using output directory: {temp_output_path}")
+        temp_output_path.mkdir(parents=True, exist_ok=True)
 
-        # Separation
-        separated_files_dir = await asyncio.to_thread(
-            run_demucs_separation, trimmed_audio_path, temp_output_path
-        )
+        # Separation, while the original clip is encoded and uploaded alongside
+        async def _export_and_upload_original(export, *args):
+            orig_mp3 = await asyncio.to_thread(export, *args, temp_output_path)
+            return await asyncio.to_thread(
+                upload_and_get_presigned_urls, [orig_mp3], temp_output_path.name
+            )
+
+        if cached_clip is not None:
+            stems, samplerate = cached_clip.stems, cached_clip.samplerate
+            original_upload = asyncio.create_task(
+                _export_and_upload_original(write_original_mp3, cached_clip.original_mp3)
+            )
+        else:
+            original_upload = asyncio.create_task(
+                _export_and_upload_original(export_original_mp3, trimmed_audio_path)
+            )
+            try:
+                stems, samplerate = await asyncio.to_thread(
+                    run_demucs_separation, trimmed_audio_path, shifts
+                )
+            except Exception:
+                # Let the original clip finish so cleanup doesn't race with it
+                await asyncio.gather(original_upload, return_exceptions=True)
+                raise
 
-        asyncio.create_task(update_task_status(callback_url_str, TaskStatusUpdate(status="in_progress", message="Merging and Uploading")))
+        send_task_status(callback_url_str, TaskStatusUpdate(status="in_progress", message="Merging and Uploading"))
 
-        # Merge
-        mp3s = await asyncio.to_thread(
-            merge_stems_and_export, separated_files_dir, trimmed_audio_path, temp_output_path
-        )
+        # Merge and upload, each mix is uploaded as soon as it is encoded
+        async def _export_and_upload_mix(outname, selected):
+            mp3 = await asyncio.to_thread(
+                mix_and_export_mp3, selected, samplerate, temp_output_path / outname
+            )
+            return await asyncio.to_thread(
+                upload_and_get_presigned_urls, [mp3], temp_output_path.name
+            )
 
-        # Upload
-        valid_mp3s = [f for f in mp3s.values() if f]
-        urls = await asyncio.to_thread(
-            upload_and_get_presigned_urls, valid_mp3s, temp_output_path.name
+        mixes = select_stem_mixes(stems)
+        results = await asyncio.gather(
+            original_upload,
+            *(
+                _export_and_upload_mix(outname, selected)
+                for outname, selected in mixes.items()
+                if selected
+            ),
+            return_exceptions=True,
         )
+        # Everything has finished by now, so failing here can't race with cleanup
+        urls = {}
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+            urls.update(result)
+
+        if clip_key is not None and cached_clip is None:
+            await asyncio.to_thread(
+                cache_clip, clip_key, stems, samplerate, temp_output_path / ORIGINAL_MP3_NAME, dir_name
+            )
 
         # Map filenames to schema keys
         file_key_mapping = {
@@ -183,18 +285,18 @@ async def process_link_separation_task(
             file_keys=final_urls 
         )
         
-        asyncio.create_task(update_task_status(callback_url_str, result_body))
+        send_task_status(callback_url_str, result_body)
         
-        # Cleanup
-        if trimmed_audio_path and temp_output_path:
-             cleanup_files(trimmed_audio_path, temp_output_path)
+        # Cleanup, off the event loop since removing directories can be slow
+        if trimmed_audio_path or temp_output_path:
+             await asyncio.to_thread(cleanup_files, trimmed_audio_path, temp_output_path)
 
     except Exception as e:
         logger.error(f"Task failed: {e}")
-        asyncio.create_task(update_task_status(callback_url_str, TaskStatusUpdate(status="failed", message=str(e))))
+        send_task_status(callback_url_str, TaskStatusUpdate(status="failed", message=str(e)))
         # Only cleanup if paths were assigned
         if trimmed_audio_path or temp_output_path:
-             cleanup_files(trimmed_audio_path, temp_output_path)
+             await asyncio.to_thread(cleanup_files, trimmed_audio_path, temp_output_path)
 
 def list_bucket_directories(directory: str | None):
     return s3.list_directories(directory)
\ No newline at end of file
@@ -1,5 +1,7 @@
 import spotipy
+from spotipy.cache_handler import MemoryCacheHandler
 from spotipy.oauth2 import SpotifyClientCredentials
+from app.cache import LRUCache
 from app.logger import logger
 from app.config import settings
 import random
@@ -34,12 +36,38 @@ sp = spotipy.Spotify(
         client_id=settings.spotify_client_id,
         client_secret=settings.spotify_client_secret,
         requests_session=session,
+        # Keep the token in memory instead of re-reading a .cache file per call
+        cache_handler=MemoryCacheHandler(),
     ),
     requests_session=session,
     requests_timeout=30,
 )
 
 
+# Playlist sizes rarely change, so repeat requests can skip the total lookup
+PLAYLIST_TOTAL_CACHE_TTL = 300
+PLAYLIST_TOTAL_CACHE_MAX_SIZE = 256
+_playlist_total_cache: LRUCache[str, int] = LRUCache(
+    max_size=PLAYLIST_TOTAL_CACHE_MAX_SIZE, ttl=PLAYLIST_TOTAL_CACHE_TTL
+)
+
+
+def _get_playlist_total(playlist_id: str) -> int:
+    """Returns the number of tracks in a playlist, cached for a few minutes."""
+    total_tracks = _playlist_total_cache.get(playlist_id)
+    if total_tracks is not None:
+        return total_tracks
+
+    response = sp.playlist_tracks(playlist_id, fields="total", limit=1)
+    if not response:
+         logger.error("Failed to fetch playlist details.")
+         raise ValueError("Failed to fetch playlist details.")
+
+    total_tracks = response["total"]
+    _playlist_total_cache.set(playlist_id, total_tracks)
+    return total_tracks
+
+
 def get_random_track_from_playlist(playlist_url_or_id):
     """Fetches a random track from a given Spotify playlist efficiently."""
 
@@ -53,12 +81,7 @@ def get_random_track_from_playlist(playlist_url_or_id):
 
     try:
         # 2. Get the total number of tracks
-        response = sp.playlist_tracks(playlist_id, fields="total", limit=1)
-        if not response:
-             logger.error("Failed to fetch playlist details.")
-             raise ValueError("Failed to fetch playlist details.")
-        
-        total_tracks = response["total"]
+        total_tracks = _get_playlist_total(playlist_id)
 
         if total_tracks == 0:
             logger.error("No tracks found in the playlist.")
@@ -88,6 +111,11 @@ def get_random_track_from_playlist(playlist_url_or_id):
 
             items = response.get("items", [])
             if not items:
+                # The playlist may have shrunk since its total was cached
+                _playlist_total_cache.pop(playlist_id)
+                total_tracks = _get_playlist_total(playlist_id)
+                if total_tracks == 0:
+                    raise ValueError("No tracks found in the playlist.")
                 continue
 
             track_item = items[0]
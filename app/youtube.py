@@ -1,50 +1,46 @@
+from app.cache import LRUCache
 from app.config import settings
-from app.files import cleanup_files, print_directory_tree
+from app.files import print_directory_tree
 from app.logger import logger
 
 
+import numpy as np
 import yt_dlp
 from yt_dlp.networking.impersonate import ImpersonateTarget
 from fastapi import HTTPException
 
 
+import copy
+import logging
 import os
-import subprocess
+import re
 import shutil
 from pathlib import Path
 
 
-def download_and_trim_youtube_audio(
-    url: str,
-    start_time: int | None,
-    duration: int,
-    download_path: Path,
-    search_term: str | None = None,
-) -> tuple[Path, dict]:
-    """Downloads audio from a YouTube URL and trims it using ffmpeg. If start_time is None, auto-pick using heatmap."""
-    if search_term:
-        logger.info(
-            f"Starting download_and_trim_youtube_audio for search term: {search_term}, duration: {duration}, download_path: {download_path}"
-        )
-        youtube_url = f"ytsearch1: {search_term}"
-    else:
-        logger.info(
-            f"Starting download_and_trim_youtube_audio for URL: {url}, start_time: {start_time}, duration: {duration}, download_path: {download_path}"
-        )
-        youtube_url = url
+# Video metadata (heatmap, formats) is reused by repeat requests for the same
+# video. The TTL stays well below the ~6h expiry of YouTube stream URLs.
+VIDEO_INFO_CACHE_TTL = 3600
+VIDEO_INFO_CACHE_MAX_SIZE = 256
+_video_info_cache: LRUCache[str, dict] = LRUCache(
+    max_size=VIDEO_INFO_CACHE_MAX_SIZE, ttl=VIDEO_INFO_CACHE_TTL
+)
+_YOUTUBE_ID_RE = re.compile(r"(?:v=|youtu\.be/|/shorts/|/embed/)([\w-]{11})")
 
-    # Ensure the download directory exists
-    download_path.mkdir(parents=True, exist_ok=True)
+# The cookies file is baked into the image, so check for it once at import
+_COOKIES_FILE = (
+    settings.yt_dlp_cookies_file_path
+    if os.path.exists(settings.yt_dlp_cookies_file_path)
+    else None
+)
 
-    # Use yt-dlp template to get video title as filename (safe)
-    # We'll use download_path as the directory, and let yt-dlp set the filename
-    outtmpl = str(download_path / "%(title)s.%(ext)s")
-    
+
+def _build_ydl_opts() -> dict:
+    """Builds the yt-dlp options shared by every download, everything but outtmpl."""
     ydl_opts = {
         "format": "bestaudio/best",
         "verbose": settings.log_level == "DEBUG",
         "impersonate": ImpersonateTarget("chrome", "119"),
-        "outtmpl": outtmpl,
         "noplaylist": True,
         "force_ipv4": True,
         "source_address": "0.0.0.0",
@@ -57,18 +53,15 @@ def download_and_trim_youtube_audio(
             }
         ],
         "logger": logger,
-        "postprocessor_args": ["-ar", "44100", "-ac", "2"],
+        "postprocessor_args": {"ffmpegextractaudio": ["-ar", "44100", "-ac", "2"]},
         "writesubtitles": False,
-        "writeinfojson": True,
+        "writeinfojson": False,
         "keepvideo": False,
-        "cookiefile": (
-            settings.yt_dlp_cookies_file_path
-            if os.path.exists(settings.yt_dlp_cookies_file_path)
-            else None
-        ),
+        "cookiefile": _COOKIES_FILE,
         "nocheckcertificate": True,
         "socket_timeout": 30,
         "retries": 5,
+        "concurrent_fragment_downloads": 8,
         "extractor_retries": 5,
         "prefer_free_formats": True,
         "extractor_args": {
@@ -86,30 +79,108 @@ def download_and_trim_youtube_audio(
     # Use aria2c if available
     if shutil.which("aria2c"):
         ydl_opts["external_downloader"] = "aria2c"
+        # Split the download across multiple connections
+        ydl_opts["external_downloader_args"] = {
+            "aria2c": [
+                "-x", "16",
+                "-s", "16",
+                "-k", "1M",
+                "--file-allocation=none",
+                "--continue=true",
+                "--max-tries=5",
+                "--retry-wait=2",
+                "--console-log-level=warn",
+                "--summary-interval=0",
+            ]
+        }
         logger.info("Using aria2c for yt-dlp.")
     else:
         logger.info("aria2c not found, using default downloader for yt-dlp.")
 
+    return ydl_opts
+
+
+# Settings and installed tools don't change at runtime, so build the options once
+_YDL_OPTS = _build_ydl_opts()
+
+
+def download_and_trim_youtube_audio(
+    url: str,
+    start_time: int | None,
+    duration: int,
+    download_path: Path,
+    search_term: str | None = None,
+) -> tuple[Path, dict]:
+    """Downloads only the requested range of audio from a YouTube URL. If start_time is None, auto-pick using heatmap."""
+    if search_term:
+        logger.info(
+            f"Starting download_and_trim_youtube_audio for search term: {search_term}, duration: {duration}, download_path: {download_path}"
+        )
+        youtube_url = f"ytsearch1: {search_term}"
+    else:
+        logger.info(
+            f"Starting download_and_trim_youtube_audio for URL: {url}, start_time: {start_time}, duration: {duration}, download_path: {download_path}"
+        )
+        youtube_url = url
+
+    # Ensure the download directory exists
+    download_path.mkdir(parents=True, exist_ok=True)
+
+    # Use yt-dlp template to get video title as filename (safe)
+    # We'll use download_path as the directory, and let yt-dlp set the filename.
+    # Only the requested range is downloaded, so the result is already trimmed.
+    outtmpl = str(download_path / "trimmed_%(title)s.%(ext)s")
+    
+    ydl_opts = {**_YDL_OPTS, "outtmpl": outtmpl}
+
     try:
-        logger.debug(f"yt_dlp options: {ydl_opts}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("yt_dlp options: %s", ydl_opts)
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            video_info_json = ydl.extract_info(youtube_url)
+            cache_key = _video_info_cache_key(youtube_url)
+            video_info_json = _get_cached_video_info(cache_key)
+            if video_info_json is None:
+                # Fetch metadata only, the heatmap decides which range to download
+                video_info_json = ydl.extract_info(youtube_url, download=False)
+
+                if not video_info_json:
+                    logger.error("yt-dlp did not return video info.")
+                    raise Exception("yt-dlp did not return video info.")
+
+                if search_term:
+                    video_info_json = video_info_json.get("entries")[0]
+                _cache_video_info(cache_key, video_info_json)
+            else:
+                logger.info(f"Using cached video info for {cache_key}")
+
+            # If start_time is None, auto-pick using heatmap
+            if start_time is None:
+                auto_start_time = pick_start_time_from_heatmap(
+                    video_info_json.get("heatmap")
+                )
+            else:
+                auto_start_time = start_time
+
+            # Download only the requested range of the audio, unless it covers
+            # the whole track and a plain download gives the same result
+            video_duration = video_info_json.get("duration")
+            if auto_start_time == 0 and video_duration and duration >= video_duration:
+                logger.info("Requested range covers the whole audio, downloading it in full.")
+            else:
+                ydl.params["download_ranges"] = yt_dlp.utils.download_range_func(
+                    None, [(auto_start_time, auto_start_time + duration)]
+                )
+            video_info_json = ydl.process_ie_result(video_info_json, download=True)
 
-        if not video_info_json:
-            logger.error("yt-dlp did not return video info.")
-            raise Exception("yt-dlp did not return video info.")
-
-        if search_term:
-            video_info_json = video_info_json.get("entries")[0]
         requested_downloads = video_info_json.get("requested_downloads")
 
         if requested_downloads is None or not isinstance(requested_downloads, list):
             logger.error("Could not find requested_downloads in yt-dlp info JSON.")
             raise Exception("Could not find requested_downloads in yt-dlp info JSON.")
 
-        original_audio_path = Path(requested_downloads[0]["filepath"]).resolve()
+        trimmed_audio_path = Path(requested_downloads[0]["filepath"]).resolve()
 
-        logger.info(f"Downloaded audio to {original_audio_path}")
+        logger.info(f"Trimmed audio saved to {trimmed_audio_path}")
 
         if settings.log_level == "DEBUG":
             print_directory_tree(download_path)
@@ -119,74 +190,58 @@ def download_and_trim_youtube_audio(
             status_code=500, detail=f"Failed to download audio from YouTube: {e}"
         )
 
-    # If start_time is None, auto-pick using heatmap
-    auto_start_time = None
-
-    if start_time is None:
-        try:
-            heatmap = video_info_json.get("heatmap")
-            if not heatmap or len(heatmap) < 4:
-                raise Exception("No or insufficient heatmap data in info JSON.")
-            # Exclude the first interval (starts at 0)
-            intervals = heatmap[1:]
-
-            # Find window of 3 consecutive intervals with highest average value
-            max_avg = -1
-            max_idx = 0
-            for i in range(len(intervals) - 2):
-                avg = sum(intervals[j]["value"] for j in range(i, i + 3)) / 3
-                if avg > max_avg:
-                    max_avg = avg
-                    max_idx = i
-
-            # Start time is 10 seconds before the start of the best window
-            best_start = int(intervals[max_idx]["start_time"])
-            auto_start_time = max(0, best_start - 10)
-            logger.info(f"Auto-picked start_time from heatmap: {auto_start_time}")
-        except Exception as e:
-            logger.error(f"Failed to auto-pick start_time from heatmap: {e}")
-            auto_start_time = 0
-    else:
-        auto_start_time = start_time
+    return trimmed_audio_path, video_info_json
 
-    trimmed_audio_path = (
-        download_path / f"trimmed_{original_audio_path.stem}.wav"
-    ).resolve()
 
-    # TODO: check if replacing this with "--download-sections" in yt-dlp would work faster
-    # Use ffmpeg to trim the audio
-    # The command is: ffmpeg -ss [start_time] -i [input_file] -t [duration] -c [output_file]
-    try:
-        subprocess.run(
-            [
-                "ffmpeg",
-                "-ss",
-                str(auto_start_time),
-                "-i",
-                str(original_audio_path),
-                "-t",
-                str(duration),
-                "-c:a",
-                "pcm_s16le",
-                "-y",
-                "-loglevel",
-                "error",
-                str(trimmed_audio_path),
-            ],
-            check=True,
-            capture_output=True,
-        )
-        logger.info(f"Trimmed audio saved to {trimmed_audio_path}")
-    except subprocess.CalledProcessError as e:
-        cleanup_files(
-            original_audio_path, original_audio_path.with_suffix(".info.json")
-        )
-        error_message = e.stderr.decode()
-        logger.error(f"Failed to trim audio with ffmpeg: {error_message}")
-        raise HTTPException(
-            status_code=500, detail=f"Failed to trim audio with ffmpeg: {error_message}"
-        )
+def get_youtube_video_id(youtube_url: str) -> str | None:
+    """Returns the video ID of a YouTube video URL, or None if it has none."""
+    match = _YOUTUBE_ID_RE.search(youtube_url)
+    return match.group(1) if match else None
 
-    cleanup_files(original_audio_path, original_audio_path.with_suffix(".info.json"))
 
-    return trimmed_audio_path, video_info_json
+def _video_info_cache_key(youtube_url: str) -> str:
+    """Keys YouTube URLs by video ID so different URL forms share a cache entry."""
+    return get_youtube_video_id(youtube_url) or youtube_url
+
+
+def get_cached_video_info(youtube_url: str) -> dict | None:
+    """Returns the cached metadata of a YouTube URL without contacting YouTube, or None."""
+    return _get_cached_video_info(_video_info_cache_key(youtube_url))
+
+
+def _get_cached_video_info(key: str) -> dict | None:
+    """Returns a copy of the cached video info for key, or None if missing or expired."""
+    info = _video_info_cache.get(key)
+    # yt-dlp adds download details to the dict it processes
+    return copy.deepcopy(info) if info is not None else None
+
+
+def _cache_video_info(key: str, info: dict):
+    _video_info_cache.set(key, copy.deepcopy(info))
+
+
+def pick_start_time_from_heatmap(heatmap: list[dict] | None) -> int:
+    """Picks a start time 10 seconds before the most replayed part of the video, or 0 if unavailable."""
+    try:
+        if not heatmap or len(heatmap) < 4:
+            raise Exception("No or insufficient heatmap data in info JSON.")
+        # Exclude the first interval (starts at 0)
+        intervals = heatmap[1:]
+
+        # Find window of 3 consecutive intervals with highest average value
+        values = np.fromiter(
+            (interval["value"] for interval in intervals),
+            dtype=np.float64,
+            count=len(intervals),
+        )
+        window_avgs = np.convolve(values, np.ones(3) / 3, mode="valid")
+        max_idx = int(np.argmax(window_avgs))
+
+        # Start time is 10 seconds before the start of the best window
+        best_start = int(intervals[max_idx]["start_time"])
+        auto_start_time = max(0, best_start - 10)
+        logger.info(f"Auto-picked start_time from heatmap: {auto_start_time}")
+        return auto_start_time
+    except Exception as e:
+        logger.error(f"Failed to auto-pick start_time from heatmap: {e}")
+        return 0
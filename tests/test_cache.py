@@ -0,0 +1,67 @@
+import unittest
+from unittest import mock
+
+from app import cache
+from app.cache import LRUCache
+
+class TestLRUCache(unittest.TestCase):
+    def test_returns_cached_values(self):
+        lru = LRUCache(max_size=2)
+        lru.set("a", 1)
+        self.assertEqual(lru.get("a"), 1)
+        self.assertIsNone(lru.get("b"))
+
+    def test_expired_entries_are_dropped(self):
+        lru = LRUCache(ttl=10)
+        with mock.patch.object(cache.time, "monotonic", return_value=100):
+            lru.set("a", 1)
+        with mock.patch.object(cache.time, "monotonic", return_value=110):
+            self.assertEqual(lru.get("a"), 1)
+        with mock.patch.object(cache.time, "monotonic", return_value=111):
+            self.assertIsNone(lru.get("a"))
+        self.assertNotIn("a", lru)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        lru = LRUCache(max_size=2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertEqual(lru.get("a"), 1)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("c"), 3)
+
+    def test_evicts_by_weight(self):
+        lru = LRUCache(max_weight=10, weigh=len)
+        lru.set("a", "xxxx")
+        lru.set("b", "xxxx")
+        lru.set("c", "xxxx")
+        self.assertNotIn("a", lru)
+        self.assertEqual(len(lru), 2)
+        # Replacing an entry releases the weight of the old value
+        lru.set("c", "x")
+        lru.set("d", "xxxx")
+        self.assertEqual(len(lru), 3)
+
+    def test_values_heavier_than_the_cache_are_skipped(self):
+        lru = LRUCache(max_weight=3, weigh=len)
+        lru.set("a", "xx")
+        self.assertFalse(lru.set("b", "xxxx"))
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("a"), "xx")
+
+    def test_pop_and_clear(self):
+        lru = LRUCache(max_weight=10, weigh=len)
+        lru.set("a", "xxxx")
+        lru.set("b", "xxxx")
+        lru.pop("a")
+        lru.pop("missing")
+        self.assertNotIn("a", lru)
+        lru.clear()
+        self.assertEqual(len(lru), 0)
+        # The full weight is available again after clearing
+        lru.set("c", "x" * 10)
+        self.assertIn("c", lru)
+
+if __name__ == "__main__":
+    unittest.main()
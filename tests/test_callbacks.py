@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+from pathlib import Path
+from unittest import mock
+from dotenv import load_dotenv
+
+# Load environment variables from .env in the project root
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(dotenv_path=ROOT_DIR / ".env")
+
+# app.s3 builds its OCI client at import, which needs a real config file
+with mock.patch("oci.config.from_file", return_value={}), mock.patch(
+    "oci.object_storage.ObjectStorageClient"
+), mock.patch("oci.object_storage.UploadManager"):
+    from app import service
+
+from app.schema import TaskStatusUpdate
+
+SLOW_URL = "https://slow.example.com/cb"
+FAST_URL = "https://fast.example.com/cb"
+
+def status(message):
+    return TaskStatusUpdate(status="in_progress", message=message)
+
+class TestCallbackWorkers(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.delays = {}
+        patcher = mock.patch.object(service, "update_task_status", side_effect=self._fake_update)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _fake_update(self, url, data):
+        await asyncio.sleep(self.delays.get(url, 0))
+        self.sent.append((url, data.message))
+
+    def test_callbacks_keep_their_order_per_url(self):
+        self.delays[SLOW_URL] = 0.05
+
+        async def run():
+            for message in ["a1", "a2", "a3"]:
+                service.send_task_status(SLOW_URL, status(message))
+            service.send_task_status(FAST_URL, status("b1"))
+            service.send_task_status(FAST_URL, status("b2"))
+            await service.stop_callback_worker()
+
+        asyncio.run(run())
+
+        self.assertEqual([m for url, m in self.sent if url == SLOW_URL], ["a1", "a2", "a3"])
+        self.assertEqual([m for url, m in self.sent if url == FAST_URL], ["b1", "b2"])
+        # The slow host doesn't hold back callbacks for other URLs
+        self.assertEqual(self.sent[:2], [(FAST_URL, "b1"), (FAST_URL, "b2")])
+
+    def test_stop_drains_queued_callbacks(self):
+        async def run():
+            for i in range(5):
+                service.send_task_status(SLOW_URL, status(str(i)))
+            await service.stop_callback_worker()
+
+        asyncio.run(run())
+
+        self.assertEqual([m for _, m in self.sent], ["0", "1", "2", "3", "4"])
+        self.assertEqual(service._pending_callbacks, {})
+        self.assertEqual(service._callback_workers, {})
+
+    def test_stop_cancels_callbacks_after_timeout(self):
+        self.delays[SLOW_URL] = 10
+
+        async def run():
+            service.send_task_status(SLOW_URL, status("stuck"))
+            service.send_task_status(FAST_URL, status("sent"))
+            await service.stop_callback_worker(timeout=0.1)
+
+        asyncio.run(run())
+
+        self.assertEqual(self.sent, [(FAST_URL, "sent")])
+        self.assertEqual(service._pending_callbacks, {})
+        self.assertEqual(service._callback_workers, {})
+
+if __name__ == "__main__":
+    unittest.main()
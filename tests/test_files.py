@@ -0,0 +1,206 @@
+import importlib.util
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+from dotenv import load_dotenv
+
+import numpy as np
+
+# Load environment variables from .env in the project root
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(dotenv_path=ROOT_DIR / ".env")
+
+from app import files
+from app.cache import LRUCache
+from app.files import DemucsBatcher, is_audio_silent, run_ffmpeg
+
+class TestIsAudioSilent(unittest.TestCase):
+    def test_all_zero_audio_is_silent(self):
+        self.assertTrue(is_audio_silent(np.zeros((2, 44100), dtype="float32")))
+
+    def test_empty_audio_is_silent(self):
+        self.assertTrue(is_audio_silent(np.zeros((2, 0), dtype="float32")))
+
+    def test_quiet_audio_is_silent(self):
+        # -60 dB peak, below the -50 dB threshold
+        samples = np.full((2, 44100), 10 ** (-60 / 20), dtype="float32")
+        self.assertTrue(is_audio_silent(samples))
+
+    def test_loud_audio_is_not_silent(self):
+        t = np.linspace(0, 1, 44100, dtype="float32")
+        tone = 0.5 * np.sin(2 * np.pi * 440 * t)
+        self.assertFalse(is_audio_silent(np.stack([tone, tone])))
+
+@unittest.skipUnless(shutil.which("ffmpeg"), "ffmpeg is not installed")
+class TestRunFfmpeg(unittest.TestCase):
+    def test_failure_with_piped_input_raises_with_stderr(self):
+        # An unknown encoder makes ffmpeg exit before reading all of stdin
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(subprocess.CalledProcessError) as ctx:
+                run_ffmpeg(
+                    [
+                        "-f", "f32le", "-ar", "44100", "-ac", "2", "-i", "pipe:0",
+                        "-c:a", "no_such_encoder", str(Path(tmp) / "out.mp3"),
+                    ],
+                    input=bytes(8 * 1024 * 1024),
+                )
+        self.assertNotEqual(ctx.exception.returncode, 0)
+        self.assertTrue(ctx.exception.stderr)
+
+@unittest.skipUnless(importlib.util.find_spec("torch"), "torch is not installed")
+class TestDemucsBatcher(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.threads = []
+        model = SimpleNamespace(audio_channels=2, samplerate=100)
+        patchers = [
+            mock.patch.object(files, "get_demucs_model", return_value=(model, "cpu")),
+            mock.patch.object(files, "_apply_demucs", side_effect=self._fake_apply),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _fake_apply(self, model, device, batch, shifts):
+        import torch
+
+        self.calls.append((tuple(batch.shape), shifts))
+        self.threads.append(threading.current_thread().name)
+        if shifts == 3:
+            raise RuntimeError("boom")
+        # Two fake "stems": the input itself and the input doubled
+        return torch.stack([batch, batch * 2], dim=1)
+
+    def _separate_concurrently(self, batcher, requests):
+        import torch
+
+        results = [None] * len(requests)
+
+        def run(i, length, shifts):
+            wav = torch.arange(2 * length, dtype=torch.float32).reshape(2, length) + i
+            try:
+                results[i] = (wav, batcher.separate(wav, shifts))
+            except Exception as e:
+                results[i] = (wav, e)
+
+        threads = [
+            threading.Thread(target=run, args=(i, length, shifts))
+            for i, (length, shifts) in enumerate(requests)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_groups_by_shifts_pads_and_crops(self):
+        import torch
+
+        batcher = DemucsBatcher(max_batch_size=4, max_wait=0.5)
+        results = self._separate_concurrently(batcher, [(100, 1), (150, 1), (80, 2)])
+
+        self.assertCountEqual(self.calls, [((2, 2, 150), 1), ((1, 2, 80), 2)])
+        for wav, sources in results:
+            self.assertEqual(tuple(sources.shape), (2, *wav.shape))
+            self.assertTrue(torch.equal(sources[0], wav))
+            self.assertTrue(torch.equal(sources[1], wav * 2))
+
+    def test_exception_only_fails_its_own_batch(self):
+        batcher = DemucsBatcher(max_batch_size=4, max_wait=0.5)
+        results = self._separate_concurrently(batcher, [(100, 1), (120, 3), (90, 3)])
+
+        self.assertNotIsInstance(results[0][1], Exception)
+        for _, result in results[1:]:
+            self.assertIsInstance(result, RuntimeError)
+
+    def test_pads_to_the_next_batch_size_when_compiled(self):
+        import torch
+
+        self.assertEqual(DemucsBatcher(max_batch_size=4, max_wait=0).batch_sizes, [1, 2, 4])
+        self.assertEqual(DemucsBatcher(max_batch_size=6, max_wait=0).batch_sizes, [1, 2, 4, 6])
+        batcher = DemucsBatcher(max_batch_size=4, max_wait=0.5)
+        with mock.patch.object(files, "demucs_compile_enabled", return_value=True):
+            results = self._separate_concurrently(batcher, [(100, 1), (150, 1), (120, 1)])
+            self.assertEqual(self.calls, [((4, 2, 150), 1)])
+            self.calls.clear()
+            batcher.separate(torch.zeros(2, 100), 1)
+            self.assertEqual(self.calls, [((1, 2, 100), 1)])
+
+        for wav, sources in results:
+            self.assertTrue(torch.equal(sources[0], wav))
+
+    def test_warm_up_runs_on_the_batcher_thread(self):
+        with mock.patch.object(files, "demucs_batcher", DemucsBatcher(max_batch_size=4, max_wait=0.5)):
+            files.warm_up_demucs_model()
+        self.assertEqual(self.calls, [((1, 2, 100), files.settings.demucs_shifts)])
+        self.assertEqual(self.threads, ["demucs-batcher"])
+
+    def test_compiled_warm_up_covers_every_batch_size(self):
+        shifts = files.settings.demucs_shifts
+        with mock.patch.object(files, "demucs_batcher", DemucsBatcher(max_batch_size=4, max_wait=0.5)), \
+                mock.patch.object(files, "demucs_compile_enabled", return_value=True):
+            files.warm_up_demucs_model()
+        self.assertEqual(self.calls, [((1, 2, 100), shifts), ((2, 2, 100), shifts), ((4, 2, 100), shifts)])
+        self.assertEqual(set(self.threads), {"demucs-batcher"})
+
+class TestSeparationCache(unittest.TestCase):
+    def setUp(self):
+        patchers = [
+            mock.patch.object(
+                files,
+                "_separation_cache",
+                LRUCache(max_weight=1024 * 1024, weigh=files._separation_nbytes),
+            ),
+            mock.patch.object(files, "_clip_cache", LRUCache(max_weight=1024 * 1024, weigh=files._clip_nbytes)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _stems(self):
+        # 2 * 65536 float32 samples, 512 KiB per entry
+        return {"drums": np.zeros((2, 65536), dtype="float32")}
+
+    def test_cached_stems_are_returned_read_only(self):
+        stems = self._stems()
+        files._cache_separation(("a", 1), stems, 44100)
+        cached, samplerate = files._separation_cache.get(("a", 1))
+        self.assertEqual(samplerate, 44100)
+        self.assertFalse(cached["drums"].flags.writeable)
+        self.assertIsNone(files._separation_cache.get(("a", 2)))
+
+    def test_cache_is_bounded_by_stem_bytes(self):
+        files._cache_separation(("a", 1), self._stems(), 44100)
+        files._cache_separation(("b", 1), self._stems(), 44100)
+        files._cache_separation(("c", 1), self._stems(), 44100)
+        self.assertNotIn(("a", 1), files._separation_cache)
+        self.assertIn(("c", 1), files._separation_cache)
+        stems = {"drums": np.zeros((2, 262144), dtype="float32")}
+        files._cache_separation(("d", 1), stems, 44100)
+        self.assertNotIn(("d", 1), files._separation_cache)
+
+    def test_clip_keeps_its_original_mp3_and_folder(self):
+        clip_key = ("dQw4w9WgXcQ", 30, 60, 1)
+        stems = self._stems()
+        with tempfile.TemporaryDirectory() as tmp:
+            original = Path(tmp) / files.ORIGINAL_MP3_NAME
+            original.write_bytes(b"ID3 original")
+            files.cache_clip(clip_key, stems, 44100, original, "Song_Title")
+
+            cached = files.get_cached_clip(clip_key)
+            self.assertIs(cached.stems, stems)
+            self.assertEqual((cached.samplerate, cached.original_mp3, cached.dir_name), (44100, b"ID3 original", "Song_Title"))
+            self.assertFalse(cached.stems["drums"].flags.writeable)
+            self.assertIsNone(files.get_cached_clip(("dQw4w9WgXcQ", 30, 60, 2)))
+
+            output_dir = Path(tmp) / "out"
+            output_dir.mkdir()
+            self.assertEqual(files.write_original_mp3(cached.original_mp3, output_dir).read_bytes(), b"ID3 original")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Load environment variables from .env in the project root
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(dotenv_path=ROOT_DIR / ".env")
+
+from app.youtube import pick_start_time_from_heatmap
+
+def make_heatmap(values, interval=5.0):
+    return [
+        {"start_time": i * interval, "end_time": (i + 1) * interval, "value": value}
+        for i, value in enumerate(values)
+    ]
+
+class TestPickStartTimeFromHeatmap(unittest.TestCase):
+    def test_picks_window_with_highest_average(self):
+        # Best 3-interval window (after skipping the first) starts at index 5 -> 25s
+        heatmap = make_heatmap([1.0, 0.1, 0.2, 0.1, 0.3, 0.9, 0.8, 0.9, 0.2, 0.1])
+        self.assertEqual(pick_start_time_from_heatmap(heatmap), 15)
+
+    def test_start_is_clamped_to_zero(self):
+        heatmap = make_heatmap([0.0, 1.0, 1.0, 1.0, 0.1, 0.1])
+        self.assertEqual(pick_start_time_from_heatmap(heatmap), 0)
+
+    def test_first_best_window_wins_ties(self):
+        heatmap = make_heatmap([0.0, 0.1, 0.1, 0.1, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5], interval=10.0)
+        self.assertEqual(pick_start_time_from_heatmap(heatmap), 30)
+
+    def test_missing_or_short_heatmap_falls_back_to_zero(self):
+        self.assertEqual(pick_start_time_from_heatmap(None), 0)
+        self.assertEqual(pick_start_time_from_heatmap(make_heatmap([0.5, 0.6, 0.7])), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+from pathlib import Path
+from unittest import mock
+from dotenv import load_dotenv
+
+# Load environment variables from .env in the project root
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(dotenv_path=ROOT_DIR / ".env")
+
+from app import spotify
+from app.spotify import get_random_track_from_playlist
+
+class TestPlaylistTotalCache(unittest.TestCase):
+    def setUp(self):
+        spotify._playlist_total_cache.clear()
+        self.addCleanup(spotify._playlist_total_cache.clear)
+
+    def test_stale_total_is_refetched_before_retrying(self):
+        # The cached total says 100 tracks, but the playlist has shrunk to 1
+        spotify._playlist_total_cache.set("a", 100)
+        track = {"name": "Song"}
+
+        def playlist_tracks(playlist_id, fields, limit, offset=0):
+            if fields == "total":
+                return {"total": 1}
+            return {"items": [{"track": track}] if offset == 0 else []}
+
+        with mock.patch.object(spotify.sp, "playlist_tracks", side_effect=playlist_tracks), \
+                mock.patch.object(spotify.random, "randint", side_effect=lambda a, b: b):
+            self.assertIs(get_random_track_from_playlist("a"), track)
+        self.assertEqual(spotify._playlist_total_cache.get("a"), 1)
+
+if __name__ == "__main__":
+    unittest.main()
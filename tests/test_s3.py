@@ -0,0 +1,63 @@
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+from dotenv import load_dotenv
+
+# Load environment variables from .env in the project root
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(dotenv_path=ROOT_DIR / ".env")
+
+# app.s3 builds its OCI client at import, which needs a real config file
+with mock.patch("oci.config.from_file", return_value={}), mock.patch(
+    "oci.object_storage.ObjectStorageClient"
+), mock.patch("oci.object_storage.UploadManager"):
+    from app import s3
+
+def make_page(names=(), prefixes=None, next_start_with=None):
+    return SimpleNamespace(
+        data=SimpleNamespace(
+            objects=[SimpleNamespace(name=name) for name in names],
+            prefixes=prefixes,
+            next_start_with=next_start_with,
+        )
+    )
+
+class TestListDirectories(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        patcher = mock.patch.object(s3, "object_storage_client", self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_merges_prefixes_from_every_page(self):
+        self.client.list_objects.side_effect = [
+            make_page(prefixes=["song_a/", "song_b/"], next_start_with="song_c/"),
+            make_page(names=["loose_file.mp3"], prefixes=["song_c/"]),
+        ]
+
+        result = s3.list_directories(None)
+
+        self.assertEqual(result, {"directories": ["song_a", "song_b", "song_c"]})
+        starts = [call.kwargs["start"] for call in self.client.list_objects.call_args_list]
+        self.assertEqual(starts, [None, "song_c/"])
+        for call in self.client.list_objects.call_args_list:
+            self.assertEqual(call.kwargs["delimiter"], "/")
+
+    def test_merges_objects_from_every_page(self):
+        self.client.list_objects.side_effect = [
+            make_page(names=["song_a/drums.mp3"], next_start_with="song_a/original.mp3"),
+            make_page(names=["song_a/original.mp3"]),
+        ]
+
+        result = s3.list_directories("song_a")
+
+        self.assertEqual(
+            result,
+            {"directory": "song_a", "objects": ["song_a/drums.mp3", "song_a/original.mp3"]},
+        )
+        for call in self.client.list_objects.call_args_list:
+            self.assertEqual(call.kwargs["prefix"], "song_a/")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from pathlib import Path
+from dotenv import load_dotenv
+from pydantic import ValidationError
+
+# Load environment variables from .env in the project root
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(dotenv_path=ROOT_DIR / ".env")
+
+from app.schema import SeparateFromLinkRequest
+
+CALLBACK_URL = "https://example.com/callback"
+
+class TestSeparateFromLinkRequestUrls(unittest.TestCase):
+    def test_accepts_youtube_and_spotify_links(self):
+        urls = [
+            "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+            "https://youtube.com/watch?v=dQw4w9WgXcQ",
+            "https://m.youtube.com/watch?v=dQw4w9WgXcQ",
+            "https://music.youtube.com/watch?v=dQw4w9WgXcQ",
+            "https://youtu.be/dQw4w9WgXcQ",
+            "http://www.youtube.com/shorts/dQw4w9WgXcQ",
+            "https://open.spotify.com/playlist/324VWVYDNw9wQgBPboPNHh?si=5a97d8809c3f4940",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                request = SeparateFromLinkRequest(url=url, callback_url=CALLBACK_URL)
+                self.assertEqual(request.url, url)
+
+    def test_rejects_other_hosts_and_schemes(self):
+        urls = [
+            "https://example.com/watch?v=dQw4w9WgXcQ",
+            "https://youtube.com.evil.com/watch?v=dQw4w9WgXcQ",
+            "ftp://www.youtube.com/watch?v=dQw4w9WgXcQ",
+            "javascript:alert(1)",
+            "www.youtube.com/watch?v=dQw4w9WgXcQ",
+            "https://youtu.be/dQw4w9WgXcQ\n",
+            "https://youtu.be/dQw4w9WgXcQ https://example.com",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with self.assertRaises(ValidationError):
+                    SeparateFromLinkRequest(url=url, callback_url=CALLBACK_URL)
+
+    def test_accepts_http_callback_urls(self):
+        for callback_url in ["https://example.com/cb?task=1", "http://localhost:8000/cb"]:
+            with self.subTest(callback_url=callback_url):
+                request = SeparateFromLinkRequest(url="https://youtu.be/dQw4w9WgXcQ", callback_url=callback_url)
+                self.assertEqual(request.callback_url, callback_url)
+
+    def test_rejects_invalid_callback_urls(self):
+        callback_urls = [
+            "ftp://example.com/cb",
+            "https://example.com/c b",
+            "example.com/cb",
+            "https://example.com/cb\n",
+            "https://example.com/" + "a" * 2048,
+        ]
+        for callback_url in callback_urls:
+            with self.subTest(callback_url=callback_url[:40]):
+                with self.assertRaises(ValidationError):
+                    SeparateFromLinkRequest(url="https://youtu.be/dQw4w9WgXcQ", callback_url=callback_url)
+
+if __name__ == "__main__":
+    unittest.main()
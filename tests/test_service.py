@@ -0,0 +1,89 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from dotenv import load_dotenv
+
+import numpy as np
+
+# Load environment variables from .env in the project root
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(dotenv_path=ROOT_DIR / ".env")
+
+# app.s3 builds its OCI client at import, which needs a real config file
+with mock.patch("oci.config.from_file", return_value={}), mock.patch(
+    "oci.object_storage.ObjectStorageClient"
+), mock.patch("oci.object_storage.UploadManager"):
+    from app import service
+
+from app import files
+from app.cache import LRUCache
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+VIDEO_INFO = {"title": "Song / Title", "duration": 200}
+
+class TestClipCache(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        self.uploads = []
+        stems = {
+            name: np.full((2, 100), 0.1, dtype="float32")
+            for name in ["drums", "bass", "guitar", "other", "piano", "vocals"]
+        }
+        patchers = [
+            mock.patch.object(service, "OUTPUT_DIR", self.tmp / "out"),
+            mock.patch.object(service, "update_task_status", mock.AsyncMock()),
+            mock.patch.object(service, "run_demucs_separation", return_value=(stems, 44100)),
+            mock.patch.object(service, "upload_and_get_presigned_urls", side_effect=self._fake_upload),
+            mock.patch.object(service, "get_cached_video_info", return_value=VIDEO_INFO),
+            mock.patch.object(files, "run_ffmpeg", side_effect=self._fake_ffmpeg),
+            mock.patch.object(files, "_clip_cache", LRUCache(max_weight=1024 * 1024, weigh=files._clip_nbytes)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _fake_ffmpeg(self, args, input=None):
+        Path(args[-1]).write_bytes(b"encoded " + Path(args[-1]).name.encode())
+
+    def _fake_upload(self, paths, folder):
+        for path in paths:
+            self.uploads.append((folder, path.name, path.read_bytes()))
+        return {path.name: f"{folder}/{path.name}" for path in paths}
+
+    def _download(self, url, start_time, duration, download_path, search_term):
+        # yt-dlp names the file after its own sanitized title
+        path = self.tmp / "trimmed_Song ⧸ Title.wav"
+        path.write_bytes(b"RIFF")
+        return path, dict(VIDEO_INFO)
+
+    def _run(self, start_time):
+        async def run():
+            await service.process_link_separation_task(URL, start_time, 30, "https://example.com/cb")
+            await service.stop_callback_worker()
+
+        asyncio.run(run())
+
+    def test_repeat_request_reuses_the_original_clip_and_folder(self):
+        with mock.patch.object(service, "download_and_trim_youtube_audio", side_effect=self._download) as download:
+            self._run(start_time=10)
+            first_uploads, self.uploads = self.uploads, []
+            self._run(start_time=10)
+
+        download.assert_called_once()
+        self.assertEqual(service.run_demucs_separation.call_count, 1)
+        self.assertCountEqual(self.uploads, first_uploads)
+        self.assertIn(("Song___Title", files.ORIGINAL_MP3_NAME, b"encoded original_trimmed.mp3"), self.uploads)
+
+    def test_requests_without_a_start_time_always_download(self):
+        with mock.patch.object(service, "download_and_trim_youtube_audio", side_effect=self._download) as download:
+            self._run(start_time=None)
+            self._run(start_time=None)
+
+        self.assertEqual(download.call_count, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Load environment variables from .env in the project root
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(dotenv_path=ROOT_DIR / ".env")
+
+from app import youtube
+from app.youtube import _cache_video_info, _get_cached_video_info, _video_info_cache_key
+
+class TestVideoInfoCacheKey(unittest.TestCase):
+    def test_url_forms_share_the_video_id(self):
+        urls = [
+            "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+            "https://www.youtube.com/watch?list=PL123&v=dQw4w9WgXcQ&t=42",
+            "https://youtu.be/dQw4w9WgXcQ?si=abc",
+            "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+            "https://www.youtube.com/embed/dQw4w9WgXcQ",
+        ]
+        self.assertEqual({_video_info_cache_key(url) for url in urls}, {"dQw4w9WgXcQ"})
+
+    def test_search_terms_are_used_as_is(self):
+        self.assertEqual(_video_info_cache_key("ytsearch1: Artist - Song"), "ytsearch1: Artist - Song")
+
+class TestVideoInfoCache(unittest.TestCase):
+    def setUp(self):
+        youtube._video_info_cache.clear()
+        self.addCleanup(youtube._video_info_cache.clear)
+
+    def test_returns_cached_info(self):
+        _cache_video_info("a", {"id": "a", "heatmap": [1, 2]})
+        self.assertEqual(_get_cached_video_info("a"), {"id": "a", "heatmap": [1, 2]})
+        self.assertIsNone(_get_cached_video_info("b"))
+
+    def test_cached_info_is_isolated_from_callers(self):
+        info = {"id": "a", "formats": [{"url": "x"}]}
+        _cache_video_info("a", info)
+        # Changes to the stored dict or to a returned copy must not leak into the cache
+        info["formats"].append({"url": "y"})
+        returned = _get_cached_video_info("a")
+        returned["requested_downloads"] = [{"filepath": "/tmp/a.wav"}]
+        returned["formats"][0]["url"] = "z"
+        self.assertEqual(_get_cached_video_info("a"), {"id": "a", "formats": [{"url": "x"}]})
+
+if __name__ == "__main__":
+    unittest.main()